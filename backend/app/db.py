@@ -1,9 +1,13 @@
+import base64
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+from bson import Binary, ObjectId
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.collection import Collection
 
 
@@ -20,30 +24,205 @@ MONGO_URI = os.getenv("MONGODB_URI")
 
 client: Optional[MongoClient] = None
 analyses: Optional[Collection] = None
+heatmaps: Optional[Collection] = None
 
 if MONGO_URI:
     try:
         client = MongoClient(MONGO_URI)
         db = client["embryo_xai"]  # logical DB name
         analyses = db["analyses"]  # collection for analysis results
+        heatmaps = db["heatmaps"]  # binary heatmaps, keyed by analysis _id
     except Exception:
         # If Mongo is misconfigured or unreachable, we fall back gracefully.
         client = None
         analyses = None
+        heatmaps = None
 
+# History listings never touch the heatmaps; only these fields are returned.
+SUMMARY_PROJECTION = {
+    "embryo_id": 1,
+    "timestamp": 1,
+    "quality_score": 1,
+    "implantation_success_probability": 1,
+    "risk_indicators": 1,
+    "notes": 1,
+    "metadata": 1,
+    "model_version": 1,
+}
 
-def save_analysis_document(doc: Dict[str, Any]) -> None:
+# Newest first; _id breaks ties between documents with the same timestamp.
+HISTORY_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+
+def is_enabled() -> bool:
+    return analyses is not None
+
+
+def ensure_indexes() -> None:
     """
-    Insert a single analysis document into MongoDB.
+    Create the compound indexes used by the history queries.
 
-    This is a best-effort helper: if MongoDB is not configured or not
-    reachable, it will silently no-op so the API still works.
+    Indexes follow equality-sort-range: equality filters (risk code,
+    fertilization method) lead, then the (timestamp, _id) sort key, then
+    range filters (quality score, maternal age). Pages are therefore read
+    from the index in sort order without an in-memory sort; range filters
+    are applied to index keys while walking it. Called at startup;
+    create_index is a no-op when the index already exists.
     """
     if analyses is None:
         return
 
+    try:
+        analyses.create_index(HISTORY_SORT)
+        for field in ("risk_indicators.code", "metadata.fertilization_method"):
+            analyses.create_index([(field, ASCENDING)] + HISTORY_SORT)
+        for field in ("quality_score", "metadata.maternal_age"):
+            analyses.create_index(HISTORY_SORT + [(field, ASCENDING)])
+    except Exception:
+        # Index creation is an optimisation; never block startup on it.
+        return
+
+
+def save_analysis_document(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Insert a single analysis document into MongoDB and return its id.
+
+    The heatmap is split off and stored as float16 bytes in the `heatmaps`
+    collection under the same _id, keeping the analysis documents small. The
+    analysis is inserted first so a failure never leaves an orphaned heatmap;
+    if only the heatmap insert fails, the analysis is kept without one.
+
+    This is a best-effort helper: if MongoDB is not configured or not
+    reachable, it will silently no-op (returning None) so the API still works.
+    """
+    if analyses is None:
+        return None
+
+    doc = dict(doc)
+    doc["_id"] = ObjectId()
+    heatmap = doc.pop("explanation_heatmap", None)
+
     try:
         analyses.insert_one(doc)
     except Exception:
         # Intentionally swallow errors to avoid breaking API responses.
-        return
\ No newline at end of file
+        return None
+
+    if heatmap is not None and heatmaps is not None:
+        try:
+            values = np.asarray(heatmap["values"], dtype="<f2")
+            heatmaps.insert_one(
+                {
+                    "_id": doc["_id"],
+                    "width": heatmap["width"],
+                    "height": heatmap["height"],
+                    "dtype": "float16",
+                    "values": Binary(values.tobytes()),
+                }
+            )
+        except Exception:
+            pass
+
+    return str(doc["_id"])
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    raw = f"{doc['timestamp'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        timestamp, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(oid)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _range(low: Any, high: Any, high_exclusive: bool = False) -> Optional[Dict[str, Any]]:
+    cond: Dict[str, Any] = {}
+    if low is not None:
+        cond["$gte"] = low
+    if high is not None:
+        cond["$lt" if high_exclusive else "$lte"] = high
+    return cond or None
+
+
+def list_analyses(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    risk_code: Optional[str] = None,
+    min_quality: Optional[float] = None,
+    max_quality: Optional[float] = None,
+    min_maternal_age: Optional[int] = None,
+    max_maternal_age: Optional[int] = None,
+    fertilization_method: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Return one page of analysis summaries (newest first) and the cursor for
+    the next page, or None when this is the last page.
+
+    Raises ValueError for a malformed cursor.
+    """
+    if analyses is None:
+        return [], None
+
+    clauses: List[Dict[str, Any]] = []
+    for field, cond in (
+        ("timestamp", _range(start, end, high_exclusive=True)),
+        ("quality_score", _range(min_quality, max_quality)),
+        ("metadata.maternal_age", _range(min_maternal_age, max_maternal_age)),
+    ):
+        if cond:
+            clauses.append({field: cond})
+    if risk_code is not None:
+        clauses.append({"risk_indicators.code": risk_code})
+    if fertilization_method is not None:
+        clauses.append({"metadata.fertilization_method": fertilization_method})
+    if cursor is not None:
+        last_ts, last_id = decode_cursor(cursor)
+        clauses.append(
+            {
+                "$or": [
+                    {"timestamp": {"$lt": last_ts}},
+                    {"timestamp": last_ts, "_id": {"$lt": last_id}},
+                ]
+            }
+        )
+
+    query = {"$and": clauses} if clauses else {}
+    # Fetch one extra document to know whether another page exists.
+    docs = list(analyses.find(query, SUMMARY_PROJECTION).sort(HISTORY_SORT).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def get_heatmap(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch the heatmap of one analysis as {"width", "height", "values"}.
+
+    Raises ValueError for a malformed id; returns None when not found.
+    """
+    if analyses is None:
+        return None
+
+    try:
+        oid = ObjectId(analysis_id)
+    except Exception as exc:
+        raise ValueError("Invalid analysis id") from exc
+
+    doc = heatmaps.find_one({"_id": oid}) if heatmaps is not None else None
+    if doc is not None:
+        values = np.frombuffer(doc["values"], dtype="<f2").astype(np.float32)
+        return {"width": doc["width"], "height": doc["height"], "values": values.tolist()}
+
+    # Documents written before heatmaps moved out still embed them.
+    legacy = analyses.find_one({"_id": oid}, {"explanation_heatmap": 1})
+    if legacy is not None and legacy.get("explanation_heatmap"):
+        return legacy["explanation_heatmap"]
+    return None
\ No newline at end of file
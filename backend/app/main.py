@@ -1,12 +1,42 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 
+from . import db
 from .schemas import (
+    AnalysisHistoryPage,
+    AnalysisSummary,
     EmbryoAnalysisResponse,
+    HeatmapExplanation,
+    ModelRegistryStatus,
     RiskIndicator,
+    SimilarEmbryo,
 )
-from .services.analysis import analyze_embryo_batch
+from .services.admission import AdmissionRejected, admission
+from .services.analysis import (
+    activate_model_version,
+    analyze_embryo_batch,
+    find_similar_embryos,
+    find_similar_to_analysis,
+    load_similarity_index,
+    model_registry_status,
+    save_similarity_index,
+    start_model_registry,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.ensure_indexes()
+    load_similarity_index()
+    # Load and warm the model in the background instead of on the first request
+    start_model_registry()
+    yield
+    save_similarity_index()
 
 
 app = FastAPI(
@@ -17,10 +47,45 @@ app = FastAPI(
         "Model integration hooks are provided in app/services/analysis.py."
     ),
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
+class AdmissionPrecheckMiddleware:
+    """
+    Sheds upload requests before their multipart body is received.
+
+    FastAPI parses every UploadFile into a spool before the endpoint runs,
+    so rejecting there would come after the whole upload was buffered. This
+    ASGI middleware answers 411/413/429 from the headers and the queue state
+    alone; requests that pass still go through admission.acquire() once the
+    frame count is known.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            content_length = dict(scope["headers"]).get(b"content-length")
+            try:
+                if content_length is None or not content_length.isdigit():
+                    raise AdmissionRejected(411, "A Content-Length header is required for uploads.")
+                admission.precheck(int(content_length))
+            except AdmissionRejected as exc:
+                response = JSONResponse(
+                    status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(AdmissionPrecheckMiddleware, paths=["/api/v1/analyze", "/api/v1/similar"])
+
 # Allow local frontends (React & Streamlit) to call the API easily
+# (added last so it wraps the precheck and rejections carry CORS headers)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,6 +95,11 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
+
+
 @app.get("/api/v1/health")
 async def health_check() -> dict:
     return {"status": "ok", "service": "embryo-xai-backend"}
@@ -52,23 +122,153 @@ async def analyze_endpoint(
     if not files:
         raise HTTPException(status_code=400, detail="At least one embryo image must be uploaded.")
 
-    # Read file bytes into memory (for now; later you may stream / store)
-    image_bytes_list: List[bytes] = []
-    for f in files:
-        content = await f.read()
-        if not content:
-            raise HTTPException(status_code=400, detail=f"File {f.filename} is empty.")
-        image_bytes_list.append(content)
+    # Admission control: oversized bodies and a full queue were already shed
+    # by AdmissionPrecheckMiddleware before the upload was read. Decide on the
+    # event loop (fast 413/429), and only wait for capacity on a worker thread
+    # so the loop keeps shedding load.
+    ticket = admission.acquire(len(files), block=False)
+    if ticket is None:
+        ticket = await run_in_threadpool(admission.acquire, len(files))
+
+    try:
+        # Read the spooled uploads into memory only once admitted
+        image_bytes_list: List[bytes] = []
+        for f in files:
+            content = await f.read()
+            if not content:
+                raise HTTPException(status_code=400, detail=f"File {f.filename} is empty.")
+            image_bytes_list.append(content)
 
-    meta = {
-        "maternal_age": maternal_age,
-        "fertilization_method": fertilization_method,
-    }
+        meta = {
+            "maternal_age": maternal_age,
+            "fertilization_method": fertilization_method,
+        }
 
-    responses = analyze_embryo_batch(image_bytes_list, meta)
+        # TF work runs off the event loop
+        responses = await run_in_threadpool(analyze_embryo_batch, image_bytes_list, meta)
+    finally:
+        admission.release(ticket)
     return responses
 
 
+@app.get("/api/v1/admission")
+async def admission_metrics() -> dict:
+    """
+    Queue depth, in-flight frames and rejection counters of the analysis endpoints.
+    """
+    return admission.metrics()
+
+
+@app.get("/api/v1/analyses", response_model=AnalysisHistoryPage)
+def list_analyses_endpoint(
+    start: Optional[datetime] = Query(None, description="Only analyses at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only analyses before this time"),
+    risk_code: Optional[str] = Query(None, description="Only analyses flagged with this risk code"),
+    min_quality: Optional[float] = Query(None, ge=0, le=100),
+    max_quality: Optional[float] = Query(None, ge=0, le=100),
+    min_maternal_age: Optional[int] = Query(None, ge=0),
+    max_maternal_age: Optional[int] = Query(None, ge=0),
+    fertilization_method: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+) -> AnalysisHistoryPage:
+    """
+    List stored analyses, newest first, with cursor pagination.
+    Heatmaps are not included; fetch them per analysis.
+    """
+    if not db.is_enabled():
+        raise HTTPException(status_code=503, detail="Analysis history requires MongoDB.")
+
+    try:
+        docs, next_cursor = db.list_analyses(
+            start=start,
+            end=end,
+            risk_code=risk_code,
+            min_quality=min_quality,
+            max_quality=max_quality,
+            min_maternal_age=min_maternal_age,
+            max_maternal_age=max_maternal_age,
+            fertilization_method=fertilization_method,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = [AnalysisSummary(analysis_id=str(d.pop("_id")), **d) for d in docs]
+    return AnalysisHistoryPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/v1/analyses/{analysis_id}/heatmap", response_model=HeatmapExplanation)
+def get_heatmap_endpoint(analysis_id: str) -> HeatmapExplanation:
+    if not db.is_enabled():
+        raise HTTPException(status_code=503, detail="Analysis history requires MongoDB.")
+
+    try:
+        heatmap = db.get_heatmap(analysis_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail=f"No heatmap for analysis {analysis_id}.")
+    return HeatmapExplanation(**heatmap)
+
+
+@app.get("/api/v1/analyses/{analysis_id}/similar", response_model=List[SimilarEmbryo])
+def similar_to_analysis_endpoint(
+    analysis_id: str,
+    k: int = Query(5, ge=1, le=100),
+) -> List[SimilarEmbryo]:
+    """
+    The k previously analyzed embryos most similar to a stored analysis.
+    """
+    hits = find_similar_to_analysis(analysis_id, k)
+    if hits is None:
+        raise HTTPException(status_code=404, detail=f"Analysis {analysis_id} is not in the similarity index.")
+    return [SimilarEmbryo(analysis_id=key, similarity=sim) for key, sim in hits]
+
+
+@app.post("/api/v1/similar", response_model=List[SimilarEmbryo])
+def similar_to_image_endpoint(
+    file: UploadFile = File(..., description="Embryo image to look up"),
+    k: int = Form(5, ge=1, le=100),
+) -> List[SimilarEmbryo]:
+    """
+    The k previously analyzed embryos most similar to an uploaded image.
+    The image itself is not analyzed or stored.
+    """
+    try:
+        with admission.admit(1):
+            content = file.file.read()
+            if not content:
+                raise HTTPException(status_code=400, detail=f"File {file.filename} is empty.")
+            hits = find_similar_embryos(content, k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if hits is None:
+        raise HTTPException(status_code=503, detail="Similarity search requires a loaded model.")
+    return [SimilarEmbryo(analysis_id=key, similarity=sim) for key, sim in hits]
+
+
+@app.get("/api/v1/models", response_model=ModelRegistryStatus)
+def list_models_endpoint() -> ModelRegistryStatus:
+    return ModelRegistryStatus(**model_registry_status())
+
+
+@app.post("/api/v1/models/{version}/activate", response_model=ModelRegistryStatus, status_code=202)
+def activate_model_endpoint(version: str) -> ModelRegistryStatus:
+    """
+    Load and warm a model version in the background; it replaces the active
+    version between batches once ready. Poll GET /api/v1/models for progress.
+    """
+    try:
+        activate_model_version(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model version {version}.")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return ModelRegistryStatus(**model_registry_status())
+
+
 @app.get("/api/v1/risk-indicators", response_model=List[RiskIndicator])
 async def list_risk_indicators() -> List[RiskIndicator]:
     """
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -18,6 +19,13 @@ class HeatmapExplanation(BaseModel):
 
 class EmbryoAnalysisResponse(BaseModel):
     embryo_id: str = Field(..., description="Internal embryo identifier for this analysis")
+    analysis_id: Optional[str] = Field(
+        None,
+        description=(
+            "Identifier of the analysis, used by the history and similarity endpoints "
+            "(None if neither stored nor indexed)"
+        ),
+    )
     quality_score: float = Field(..., ge=0, le=100, description="Embryo quality score (0-100)")
     implantation_success_probability: float = Field(
         ..., ge=0, le=1, description="Predicted implantation probability (0-1)"
@@ -31,4 +39,51 @@ class EmbryoAnalysisResponse(BaseModel):
     notes: Optional[str] = Field(
         None, description="Free-form notes or explanation text for clinicians"
     )
+    model_version: Optional[str] = Field(
+        None, description="Model version that produced this analysis (None for simulated output)"
+    )
+
+
+class AnalysisSummary(BaseModel):
+    analysis_id: str = Field(..., description="Identifier of the stored analysis")
+    embryo_id: str = Field(..., description="Internal embryo identifier for this analysis")
+    timestamp: datetime = Field(..., description="When the analysis was run (UTC)")
+    quality_score: float = Field(..., description="Embryo quality score (0-100)")
+    implantation_success_probability: float = Field(
+        ..., description="Predicted implantation probability (0-1)"
+    )
+    risk_indicators: List[RiskIndicator] = Field(
+        default_factory=list, description="List of risk indicators"
+    )
+    notes: Optional[str] = Field(None, description="Notes stored with the analysis")
+    model_version: Optional[str] = Field(None, description="Model version that produced the analysis")
+    metadata: Dict[str, Any] = Field(
+        default_factory=dict, description="Request metadata (maternal age, fertilization method)"
+    )
+
+
+class AnalysisHistoryPage(BaseModel):
+    items: List[AnalysisSummary] = Field(default_factory=list, description="Analyses, newest first")
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as `cursor` to fetch the next page; None on the last page"
+    )
+
+
+class SimilarEmbryo(BaseModel):
+    analysis_id: str = Field(..., description="Identifier of the previously analyzed embryo")
+    similarity: float = Field(..., description="Cosine similarity of the backbone embeddings (1 = identical)")
+
+
+class ModelVersionInfo(BaseModel):
+    version: str = Field(..., description="Registry version name")
+    path: str = Field(..., description="Path of the model artifact")
+    active: bool = Field(False, description="Currently serving requests")
+    loading: bool = Field(False, description="Being loaded and warmed in the background")
+
 
+class ModelRegistryStatus(BaseModel):
+    active_version: Optional[str] = Field(None, description="Version serving requests")
+    loaded_at: Optional[datetime] = Field(None, description="When the active version was loaded (UTC)")
+    loading_version: Optional[str] = Field(None, description="Version being loaded, if any")
+    last_error: Optional[str] = Field(None, description="Error of the last failed load, if any")
+    versions: List[ModelVersionInfo] = Field(default_factory=list, description="Available versions")
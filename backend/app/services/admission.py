@@ -0,0 +1,235 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+
+# --- Admission Control ---
+# EMBRYO_MAX_INFLIGHT_FRAMES: frames analyzed concurrently across all requests; with test-time
+#   augmentation every view counts, so a frame costs len(EMBRYO_TTA views) of this budget
+# EMBRYO_MAX_QUEUED_REQUESTS: requests allowed to wait for capacity; beyond that -> 429
+# EMBRYO_MAX_FRAMES_PER_REQUEST: frames accepted in one request; beyond that -> 413
+# EMBRYO_QUEUE_TIMEOUT_SECONDS: longest a request waits in the queue before -> 503
+# EMBRYO_MAX_UPLOAD_BYTES_PER_FRAME: upload size allowed per frame; a larger request body -> 413
+MAX_INFLIGHT_FRAMES = int(os.getenv("EMBRYO_MAX_INFLIGHT_FRAMES", "32"))
+MAX_QUEUED_REQUESTS = int(os.getenv("EMBRYO_MAX_QUEUED_REQUESTS", "16"))
+MAX_FRAMES_PER_REQUEST = int(os.getenv("EMBRYO_MAX_FRAMES_PER_REQUEST", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("EMBRYO_QUEUE_TIMEOUT_SECONDS", "30"))
+MAX_UPLOAD_BYTES_PER_FRAME = int(os.getenv("EMBRYO_MAX_UPLOAD_BYTES_PER_FRAME", str(20 * 1024 * 1024)))
+
+# Smoothing factor of the moving average of service time per frame
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed. Carries the HTTP status and Retry-After.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+
+
+class Ticket:
+    __slots__ = ("frames", "admitted_at")
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.admitted_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Bounds concurrent analysis work by frames in flight.
+
+    A request is admitted immediately when its frames fit under the cap and
+    nobody is queued ahead of it. Otherwise it waits in a bounded FIFO queue;
+    a full queue is rejected at once with 429 and a request that cannot be
+    admitted within the queue timeout gets 503, both with a Retry-After
+    estimated from recent service times. Admitted requests therefore see
+    bounded latency, and overload turns into fast rejections rather than
+    every request timing out together.
+
+    precheck() lets an entry point shed a request before its upload is
+    received, from the declared body size and the queue state alone.
+
+    In-flight and queued work is counted in model inputs: a frame costs
+    views_per_frame (the number of test-time augmentation views), so the
+    cap keeps bounding memory and latency when TTA multiplies each frame.
+    """
+
+    def __init__(
+        self,
+        max_inflight_frames: int = MAX_INFLIGHT_FRAMES,
+        max_queued_requests: int = MAX_QUEUED_REQUESTS,
+        max_frames_per_request: int = MAX_FRAMES_PER_REQUEST,
+        queue_timeout: float = QUEUE_TIMEOUT_SECONDS,
+        max_upload_bytes_per_frame: int = MAX_UPLOAD_BYTES_PER_FRAME,
+        views_per_frame: int = 1,
+    ):
+        self.max_inflight_frames = max(1, max_inflight_frames)
+        self.max_queued_requests = max(0, max_queued_requests)
+        self.queue_timeout = queue_timeout
+        self._requested_max_frames = max_frames_per_request
+        self._max_upload_bytes_per_frame = max(1, max_upload_bytes_per_frame)
+        self.set_views_per_frame(views_per_frame)
+
+        self._cond = threading.Condition()
+        self._inflight_frames = 0
+        self._queue: Deque[Tuple[object, int]] = deque()  # (waiter, frames), FIFO
+        self._seconds_per_frame: Optional[float] = None
+
+        self._admitted_total = 0
+        self._completed_total = 0
+        self._rejected_total = {"request_too_large": 0, "too_many_frames": 0, "queue_full": 0, "queue_timeout": 0}
+        self._peak_queued_requests = 0
+        self._queue_wait_seconds = 0.0
+
+    def set_views_per_frame(self, views: int) -> None:
+        """
+        Sets the model inputs one frame costs (1 + TTA views) and the
+        per-request limits that follow from it.
+        """
+        self.views_per_frame = max(1, views)
+        # A request larger than the in-flight cap could never be admitted
+        self.max_frames_per_request = max(
+            1, min(self._requested_max_frames, self.max_inflight_frames // self.views_per_frame)
+        )
+        self.max_request_bytes = self.max_frames_per_request * self._max_upload_bytes_per_frame
+
+    def _retry_after(self) -> int:
+        # Time to drain the current backlog at the recent per-input service time
+        backlog = self._inflight_frames + sum(frames for _, frames in self._queue)
+        estimate = (self._seconds_per_frame or 1.0) * backlog
+        return int(min(max(math.ceil(estimate), 1), 60))
+
+    def precheck(self, content_length: int) -> None:
+        """
+        Sheds a request before its body is read: 413 when the declared size
+        exceeds what the largest admissible request may upload, 429 when the
+        queue is full and no capacity is free. Reserves nothing; acquire()
+        still decides once the frame count is known.
+        """
+        with self._cond:
+            if content_length > self.max_request_bytes:
+                self._rejected_total["request_too_large"] += 1
+                raise AdmissionRejected(
+                    413, f"Request body exceeds the {self.max_request_bytes} byte upload limit."
+                )
+            saturated = self._queue or self._inflight_frames >= self.max_inflight_frames
+            if saturated and len(self._queue) >= self.max_queued_requests:
+                self._rejected_total["queue_full"] += 1
+                raise AdmissionRejected(429, "Analysis queue is full.", self._retry_after())
+
+    def acquire(self, frames: int, block: bool = True) -> Optional[Ticket]:
+        """
+        Admit a request of `frames` frames and return its ticket.
+
+        With block=False, returns None instead of queueing (used to decide on
+        the event loop before handing off to a worker thread). Raises
+        AdmissionRejected when the request is shed.
+        """
+        with self._cond:
+            if frames > self.max_frames_per_request:
+                self._rejected_total["too_many_frames"] += 1
+                raise AdmissionRejected(
+                    413, f"At most {self.max_frames_per_request} frames are accepted per request."
+                )
+
+            # Counted in model inputs from here on
+            frames = min(frames * self.views_per_frame, self.max_inflight_frames)
+            if not self._queue and self._inflight_frames + frames <= self.max_inflight_frames:
+                return self._admit(frames)
+            if len(self._queue) >= self.max_queued_requests:
+                self._rejected_total["queue_full"] += 1
+                raise AdmissionRejected(429, "Analysis queue is full.", self._retry_after())
+            if not block:
+                return None
+
+            waiter = object()
+            self._queue.append((waiter, frames))
+            self._peak_queued_requests = max(self._peak_queued_requests, len(self._queue))
+            queued_at = time.monotonic()
+            deadline = queued_at + self.queue_timeout
+            try:
+                while not (
+                    self._queue[0][0] is waiter
+                    and self._inflight_frames + frames <= self.max_inflight_frames
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected_total["queue_timeout"] += 1
+                        raise AdmissionRejected(
+                            503, "Timed out waiting for analysis capacity.", self._retry_after()
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove((waiter, frames))
+                self._queue_wait_seconds += time.monotonic() - queued_at
+                # The next waiter may now be at the head of the queue
+                self._cond.notify_all()
+            return self._admit(frames)
+
+    def _admit(self, frames: int) -> Ticket:
+        self._inflight_frames += frames
+        self._admitted_total += 1
+        return Ticket(frames)
+
+    def release(self, ticket: Ticket) -> None:
+        elapsed = time.monotonic() - ticket.admitted_at
+        with self._cond:
+            self._inflight_frames -= ticket.frames
+            self._completed_total += 1
+            per_frame = elapsed / max(ticket.frames, 1)
+            if self._seconds_per_frame is None:
+                self._seconds_per_frame = per_frame
+            else:
+                self._seconds_per_frame += _EWMA_ALPHA * (per_frame - self._seconds_per_frame)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, frames: int) -> Iterator[Ticket]:
+        """
+        Blocking acquire/release around a block of analysis work.
+        """
+        ticket = self.acquire(frames)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            rejected = dict(self._rejected_total)
+            waited = self._admitted_total + rejected["queue_timeout"]
+            return {
+                "inflight_frames": self._inflight_frames,
+                "max_inflight_frames": self.max_inflight_frames,
+                "queued_requests": len(self._queue),
+                "queued_frames": sum(frames for _, frames in self._queue),
+                "max_queued_requests": self.max_queued_requests,
+                "peak_queued_requests": self._peak_queued_requests,
+                "max_frames_per_request": self.max_frames_per_request,
+                "views_per_frame": self.views_per_frame,
+                "max_request_bytes": self.max_request_bytes,
+                "admitted_total": self._admitted_total,
+                "completed_total": self._completed_total,
+                "rejected_total": sum(rejected.values()),
+                "rejected_by_reason": rejected,
+                "mean_queue_wait_seconds": self._queue_wait_seconds / waited if waited else 0.0,
+                "seconds_per_frame": self._seconds_per_frame,
+            }
+
+
+# Shared by the FastAPI and Flask entry points of this process
+admission = AdmissionController()
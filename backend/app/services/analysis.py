@@ -1,30 +1,287 @@
+import hashlib
+import importlib.util
 import random
-from typing import Any, Dict, List
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 import tensorflow as tf
 import cv2
 import os
+import sys
 from datetime import datetime
 
-# --- Model Loading (Singleton) ---
-MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../model/fine_tuned_model.keras"))
-_MODEL = None
+# --- Model Loading (Registry) ---
+# EMBRYO_MODEL_REGISTRY: directory of versioned artifacts, <registry>/<version>/model.keras
+# MODEL_PATH is served as version 'legacy' when the registry is empty.
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../model"))
+MODEL_PATH = os.path.join(MODEL_DIR, "fine_tuned_model.keras")
+REGISTRY_DIR = os.getenv("EMBRYO_MODEL_REGISTRY", os.path.join(MODEL_DIR, "registry"))
 
-def get_model():
-    global _MODEL
-    if _MODEL is None:
-        print(f"Loading model from {MODEL_PATH}...")
-        try:
-            _MODEL = tf.keras.models.load_model(MODEL_PATH)
-            print("Model loaded successfully.")
-        except Exception as e:
-            print(f"Failed to load model: {e}")
-            # Fallback for dev if model missing/broken
-            return None
-    return _MODEL
+# Preprocessing (and TTA) are shared with the training scripts so both sides
+# feed the model identically. They are loaded by file path under private names
+# rather than by putting model/ on sys.path, where model.py and these generic
+# module names would shadow or collide with other top-level imports.
+def _load_model_module(name):
+    spec = importlib.util.spec_from_file_location(f"_embryo_model_{name}", os.path.join(MODEL_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+_preprocessing = _load_model_module("preprocessing")
+allocate_batch = _preprocessing.allocate_batch
+decode_image = _preprocessing.decode_image
+resize_into = _preprocessing.resize_into
+to_model_input = _preprocessing.to_model_input
+
+_tta = _load_model_module("tta")
+augment_batch = _tta.augment_batch
+parse_transforms = _tta.parse_transforms
+reduce_views = _tta.reduce_views
+
+from .admission import admission
+
+# --- Execution Mode ---
+# EMBRYO_PRECISION: 'float32' (default) or 'mixed_bfloat16' (bfloat16 compute, float32 heads)
+# EMBRYO_JIT_COMPILE: '1' to compile the forward pass with XLA
+PRECISION = os.getenv("EMBRYO_PRECISION", "float32")
+JIT_COMPILE = os.getenv("EMBRYO_JIT_COMPILE", "0").lower() in ("1", "true", "yes")
+# EMBRYO_TTA: comma-separated test-time augmentations, e.g. 'flip_h,flip_v,rot90' (empty = off)
+TTA_TRANSFORMS = parse_transforms(os.getenv("EMBRYO_TTA", ""))
+# EMBRYO_BATCH_BUCKETS: batch sizes (in model inputs) the forward pass is traced and XLA-compiled for
+# at load time; smaller batches are padded up to the next bucket, larger ones split into frame groups.
+# With TTA a frame group holds largest bucket // views frames, so one pass never exceeds the largest bucket.
+BATCH_BUCKETS = tuple(sorted({max(1, int(b)) for b in os.getenv("EMBRYO_BATCH_BUCKETS", "1,4,8,16,32").split(",") if b.strip()}))
+OUTPUT_HEADS = ("exp_output", "icm_output", "te_output")
+
+# Admission counts model inputs: every TTA view of a frame takes a slot
+admission.set_views_per_frame(len(TTA_TRANSFORMS))
+
+def _apply_precision(model, policy):
+    """
+    Re-creates the loaded model under the given dtype policy.
+    Output heads are kept in float32 for numerically stable scores.
+    """
+    def target_dtype(layer):
+        return "float32" if layer.name in OUTPUT_HEADS else policy
+
+    layers = [l for l in model.layers if not isinstance(l, tf.keras.layers.InputLayer)]
+    if all(l.dtype_policy.name == target_dtype(l) for l in layers):
+        return model
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        if not isinstance(layer, tf.keras.layers.InputLayer):
+            config["dtype"] = target_dtype(layer)
+        return layer.__class__.from_config(config)
+
+    clone = tf.keras.models.clone_model(model, clone_function=clone_layer)
+    clone.set_weights(model.get_weights())
+    return clone
+
+def _find_embedding_layer(model):
+    # The pooled backbone feature (2048-d for ResNet50V2)
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.layers.GlobalAveragePooling2D):
+            return layer
+    return None
+
+def _build_predict_fn(model, transforms=TTA_TRANSFORMS):
+    """
+    Forward pass returning {'heads': (N, 3) [exp, icm, te]} plus the pooled
+    backbone 'embedding' (when the model has a pooling layer).
+
+    With TTA enabled, all augmented views are generated on-device and run as
+    one (A * N) batch; 'heads' is then the mean over views, 'variance' the
+    spread, and the embedding comes from the unaugmented view.
+
+    The batch dimension is left open in the signature so a new N never
+    retraces; callers keep N to _frame_buckets so XLA compiles each size once.
+    """
+    pool = _find_embedding_layer(model)
+    outputs = list(model.outputs) + ([pool.output] if pool is not None else [])
+    infer_model = tf.keras.models.Model(model.inputs, outputs)
+    n_views = len(transforms)
+    spec = tf.TensorSpec((None,) + tuple(model.inputs[0].shape[1:]), model.inputs[0].dtype)
+
+    @tf.function(input_signature=[spec], jit_compile=JIT_COMPILE)
+    def predict(img_batch):
+        n = tf.shape(img_batch)[0]
+        if n_views > 1:
+            img_batch = augment_batch(img_batch, transforms)
+        preds = infer_model(img_batch, training=False)
+        heads = tf.concat([tf.cast(p, tf.float32) for p in preds[:3]], axis=1)
+        result = {}
+        if n_views > 1:
+            result["heads"], result["variance"] = reduce_views(heads, n_views)
+        else:
+            result["heads"] = heads
+        if len(preds) > 3:
+            result["embedding"] = tf.cast(preds[3][:n], tf.float32)
+        return result
+    return predict
+
+def _frame_buckets(n_views):
+    """
+    Frame counts one forward pass is run with; the last is the frame group size.
+    """
+    group = max(1, BATCH_BUCKETS[-1] // n_views)
+    return tuple(b for b in BATCH_BUCKETS if b < group) + (group,)
+
+def _forward(serving, frames, augment=True):
+    """
+    Runs the forward pass over a uint8 batch in frame groups, each padded up
+    to a frame bucket, so only warmed shapes run and no pass holds more than
+    the largest batch bucket of model inputs. augment=False skips TTA (for
+    callers that only need the embedding).
+    Returns (heads (N, 3), variances (N, 3) or None, embeddings (N, D) or None).
+    """
+    predict_fn = serving.predict_fn if augment else serving.embed_fn
+    buckets = _frame_buckets(len(TTA_TRANSFORMS) if augment else 1)
+    chunks = []
+    for start in range(0, len(frames), buckets[-1]):
+        chunk = frames[start:start + buckets[-1]]
+        n = len(chunk)
+        padded = np.zeros((next(b for b in buckets if b >= n),) + chunk.shape[1:], dtype=chunk.dtype)
+        padded[:n] = chunk
+        preds = predict_fn(tf.constant(to_model_input(padded, serving.model)))
+        chunks.append({key: value.numpy()[:n] for key, value in preds.items()})
+
+    heads = np.concatenate([c["heads"] for c in chunks])
+    variances = np.concatenate([c["variance"] for c in chunks]) if "variance" in chunks[0] else None
+    embeddings = np.concatenate([c["embedding"] for c in chunks]) if "embedding" in chunks[0] else None
+    return heads, variances, embeddings
 
 from ..db import save_analysis_document
 from ..schemas import EmbryoAnalysisResponse, HeatmapExplanation, RiskIndicator
+from .registry import ModelRegistry, ServingModel
+from .similarity import EmbeddingIndex
+
+def _load_serving_model(version, path):
+    """
+    Loads, converts and warms one model version (runs on the registry's loader thread).
+    """
+    print(f"Loading model {version} from {path}...")
+    model = tf.keras.models.load_model(path)
+    model = _apply_precision(model, PRECISION)
+    predict_fn = _build_predict_fn(model)
+    embed_fn = _build_predict_fn(model, transforms=("identity",)) if len(TTA_TRANSFORMS) > 1 else predict_fn
+    serving = ServingModel(version, model, predict_fn, datetime.utcnow(), embed_fn)
+    # Warm-up: trace (and XLA-compile) every frame bucket before taking traffic
+    for augment in ((True, False) if embed_fn is not predict_fn else (True,)):
+        for bucket in _frame_buckets(len(TTA_TRANSFORMS) if augment else 1):
+            _forward(serving, np.zeros((bucket,) + tuple(model.inputs[0].shape[1:]), dtype=np.uint8), augment)
+    print(f"Model {version} loaded (precision={PRECISION}, jit_compile={JIT_COMPILE}, tta={TTA_TRANSFORMS}).")
+    return serving
+
+_REGISTRY = ModelRegistry(REGISTRY_DIR, MODEL_PATH, _load_serving_model)
+
+def get_serving_model() -> Optional[ServingModel]:
+    # None falls back to simulated predictions (dev without a model)
+    return _REGISTRY.active()
+
+def start_model_registry():
+    _REGISTRY.start()
+
+def model_registry_status() -> Dict[str, Any]:
+    return _REGISTRY.status()
+
+def activate_model_version(version: str) -> None:
+    """
+    Raises KeyError for unknown versions, RuntimeError while another load is running.
+    """
+    _REGISTRY.activate(version)
+
+# --- Similarity Index ---
+# EMBRYO_EMBEDDING_INDEX_DIR: optional directory of <model version>.npz indexes, loaded at startup and saved at shutdown
+# EMBRYO_NEAR_DUPLICATE_SIMILARITY: cosine similarity from which an upload counts as a near-duplicate
+# EMBRYO_RESULT_CACHE_SIZE: recent results kept in memory for duplicate reuse
+EMBEDDING_INDEX_DIR = os.getenv("EMBRYO_EMBEDDING_INDEX_DIR")
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("EMBRYO_NEAR_DUPLICATE_SIMILARITY", "0.995"))
+RESULT_CACHE_SIZE = int(os.getenv("EMBRYO_RESULT_CACHE_SIZE", "1024"))
+
+# Embeddings from different model versions are not comparable: one index per version.
+_INDEXES: Dict[str, EmbeddingIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+_RESULT_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_RESULT_CACHE_LOCK = threading.Lock()
+
+def _index_for(version: str) -> EmbeddingIndex:
+    with _INDEXES_LOCK:
+        if version not in _INDEXES:
+            _INDEXES[version] = EmbeddingIndex()
+        return _INDEXES[version]
+
+def load_similarity_index():
+    if not EMBEDDING_INDEX_DIR or not os.path.isdir(EMBEDDING_INDEX_DIR):
+        return
+    for filename in os.listdir(EMBEDDING_INDEX_DIR):
+        if not filename.endswith(".npz"):
+            continue
+        path = os.path.join(EMBEDDING_INDEX_DIR, filename)
+        try:
+            index = _index_for(filename[:-len(".npz")])
+            index.load(path)
+            print(f"Loaded {len(index)} embeddings from {path}.")
+        except Exception as e:
+            print(f"Failed to load embedding index {path}: {e}")
+
+def save_similarity_index():
+    if not EMBEDDING_INDEX_DIR:
+        return
+    with _INDEXES_LOCK:
+        indexes = dict(_INDEXES)
+    for version, index in indexes.items():
+        try:
+            os.makedirs(EMBEDDING_INDEX_DIR, exist_ok=True)
+            index.save(os.path.join(EMBEDDING_INDEX_DIR, f"{version}.npz"))
+        except Exception as e:
+            print(f"Failed to save embedding index for {version}: {e}")
+
+def _cache_result(key, payload):
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE[key] = payload
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
+def _cached_result(key):
+    with _RESULT_CACHE_LOCK:
+        payload = _RESULT_CACHE.get(key)
+        if payload is not None:
+            _RESULT_CACHE.move_to_end(key)
+        return payload
+
+def find_similar_to_analysis(analysis_id: str, k: int) -> Optional[List[Tuple[str, float]]]:
+    """
+    The k most similar previously analyzed embryos, or None if the analysis is not indexed.
+    """
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+    for index in indexes:
+        embedding = index.get(analysis_id)
+        if embedding is not None:
+            return index.search(embedding, k, exclude=analysis_id)
+    return None
+
+def find_similar_embryos(image_bytes: bytes, k: int) -> Optional[List[Tuple[str, float]]]:
+    """
+    The k most similar previously analyzed embryos to an uploaded image.
+    Returns None when no model is loaded; raises ValueError for undecodable images.
+    """
+    serving = get_serving_model()
+    if serving is None or _find_embedding_layer(serving.model) is None:
+        return None
+    img = decode_image(image_bytes)
+    if img is None:
+        raise ValueError("Could not decode image.")
+    batch = allocate_batch(1)
+    resize_into(img, batch[0])
+    # Only the embedding is needed: skip the TTA views
+    _, _, embeddings = _forward(serving, batch, augment=False)
+    return _index_for(serving.version).search(embeddings[0], k)
 
 def _generate_gradcam(model, img_array):
     """
@@ -56,10 +313,16 @@ def _generate_gradcam(model, img_array):
             conv_outputs, predictions = grad_model(img_array)
             # We want to maximize the Expansion output (index 0) as a proxy for "importance"
             # Or average of all 3 heads? Let's use Expansion head (predictions[0])
-            start_logits = predictions['exp_output']
+            if isinstance(predictions, dict):
+                start_logits = predictions['exp_output']
+            else:
+                start_logits = predictions[0]
             loss = start_logits[:, 0]
 
         grads = tape.gradient(loss, conv_outputs)
+        # Reduced-precision models yield bfloat16 tensors; the heatmap is built in float32
+        grads = tf.cast(grads, tf.float32)
+        conv_outputs = tf.cast(conv_outputs, tf.float32)
         pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
         
         conv_outputs = conv_outputs[0]
@@ -81,51 +344,86 @@ def analyze_embryo_batch(
     image_bytes_list: List[bytes],
     metadata: Dict[str, Any],
 ) -> List[EmbryoAnalysisResponse]:
-    model = get_model()
+    # Resolve the serving version once: a hot swap never changes the model mid-batch
+    serving = get_serving_model()
+    model = serving.model if serving else None
+    model_version = serving.version if serving else None
+    index = _index_for(model_version) if serving else None
     results: List[EmbryoAnalysisResponse] = []
     
     maternal_age = metadata.get("maternal_age")
 
+    # Exact duplicates of earlier uploads are answered from the result cache
+    # without decoding; everything else is decoded into one uint8 buffer.
+    batch = allocate_batch(len(image_bytes_list))
+    digests = [hashlib.sha256(b).hexdigest() for b in image_bytes_list]
+    duplicates: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+    positions: Dict[int, int] = {}  # frame index -> row in `batch`
+
     for idx, img_bytes in enumerate(image_bytes_list):
-        embryo_id = f"embryo_{idx+1}"
-        
+        source = index.lookup_digest(digests[idx]) if index else None
+        payload = _cached_result(source) if source else None
+        if payload is not None:
+            duplicates[idx] = (source, payload)
+            continue
+
         # Preprocess
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = decode_image(img_bytes)
         if img is None:
             continue
-            
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_resized = cv2.resize(img_rgb, (224, 224))
-        img_normalized = img_resized.astype(np.float32) / 255.0
-        img_batch = np.expand_dims(img_normalized, axis=0)
-
-        # Predict
-        if model:
-            preds = model.predict(img_batch, verbose=0)
-            # preds is usually a list of arrays [exp, icm, te] if multi-output
-            # Check model output structure
-            if isinstance(preds, dict):
-                exp_pred = float(preds['exp_output'][0][0])
-                icm_pred = float(preds['icm_output'][0][0])
-                te_pred = float(preds['te_output'][0][0])
-            elif isinstance(preds, list):
-                exp_pred = float(preds[0][0][0])
-                icm_pred = float(preds[1][0][0])
-                te_pred = float(preds[2][0][0])
-            else:
-                # Single output? unlikely given our training
-                exp_pred, icm_pred, te_pred = 0, 0, 0
-                
-            # Grad-CAM
-            heatmap_raw = _generate_gradcam(model, img_batch)
-            heatmap_values = _resize_heatmap(heatmap_raw)
+        resize_into(img, batch[len(positions)])
+        positions[idx] = len(positions)
+
+    # Predict: one forward pass for all new frames (heads + embeddings,
+    # over every TTA view when enabled)
+    heads, variances, embeddings = None, None, None
+    if model and positions:
+        heads, variances, embeddings = _forward(serving, batch[:len(positions)])
+
+    for idx in range(len(image_bytes_list)):
+        embryo_id = f"embryo_{idx+1}"
+        embedding = None
+        duplicate_note = None
+
+        if idx in duplicates:
+            source, payload = duplicates[idx]
+            duplicate_note = f"Exact duplicate of analysis {source}; result reused"
+        elif idx not in positions:
+            continue
+        elif model:
+            pos = positions[idx]
+            exp_pred, icm_pred, te_pred = (float(v) for v in heads[pos])
+            heatmap = None
+            if embeddings is not None:
+                embedding = embeddings[pos]
+                # Near-duplicate of an indexed embryo: reuse its heatmap
+                # instead of running Grad-CAM again. The grading is this
+                # frame's own (its heads already ran in the batched pass), so
+                # consecutive time-lapse frames keep their own trajectory.
+                hits = index.search(embedding, 1)
+                if hits and hits[0][1] >= NEAR_DUPLICATE_SIMILARITY:
+                    source = _cached_result(hits[0][0])
+                    if source is not None:
+                        heatmap = source["heatmap"]
+                        duplicate_note = (
+                            f"Near-duplicate (similarity {hits[0][1]:.3f}) of analysis {hits[0][0]}; heatmap reused"
+                        )
+                        # Indexed once, under the source: re-adding copies
+                        # would crowd other embryos out of similarity results
+                        embedding = None
+            if heatmap is None:
+                # Grad-CAM
+                heatmap_raw = _generate_gradcam(model, to_model_input(batch[pos:pos+1], model))
+                heatmap = np.asarray(_resize_heatmap(heatmap_raw), dtype=np.float16)
+            payload = {"exp": exp_pred, "icm": icm_pred, "te": te_pred, "heatmap": heatmap,
+                       "variance": variances[pos] if variances is not None else None}
         else:
             # Fallback simulation
-            exp_pred = random.uniform(1, 6)
-            icm_pred = random.uniform(1, 3)
-            te_pred = random.uniform(1, 3)
-            heatmap_values = np.random.rand(32*32).tolist()
+            payload = {"exp": random.uniform(1, 6), "icm": random.uniform(1, 3), "te": random.uniform(1, 3),
+                       "heatmap": np.random.rand(32*32).astype(np.float16)}
+
+        exp_pred, icm_pred, te_pred = payload["exp"], payload["icm"], payload["te"]
+        heatmap_values = payload["heatmap"].astype(np.float32).tolist()
 
         # Logic to map to Frontend Schema
         # Quality Score (0-100)
@@ -156,6 +454,13 @@ def analyze_embryo_batch(
         # Notes
         print(f"DEBUG: Predicted EXP={exp_pred}, ICM={icm_pred}, TE={te_pred}")
         notes = f"Model Predictions: EXP={exp_pred:.1f}, ICM={icm_pred:.1f}, TE={te_pred:.1f}"
+        if payload.get("variance") is not None:
+            # Disagreement between augmented views: higher = less certain
+            exp_var, icm_var, te_var = (float(v) for v in payload["variance"])
+            notes = (f"{notes}. TTA uncertainty ({len(TTA_TRANSFORMS)} views, variance): "
+                     f"EXP={exp_var:.3f}, ICM={icm_var:.3f}, TE={te_var:.3f}")
+        if duplicate_note:
+            notes = f"{notes}. {duplicate_note}."
 
         result = EmbryoAnalysisResponse(
             embryo_id=embryo_id,
@@ -164,13 +469,23 @@ def analyze_embryo_batch(
             risk_indicators=risks,
             explanation_heatmap=HeatmapExplanation(width=32, height=32, values=heatmap_values),
             notes=notes,
+            model_version=model_version,
         )
         results.append(result)
 
         # Save to DB (Fire & Forget)
-        doc = result.model_dump()
+        doc = result.model_dump(exclude={"analysis_id"})
         doc["timestamp"] = datetime.utcnow()
         doc["metadata"] = metadata
-        save_analysis_document(doc)
+        result.analysis_id = save_analysis_document(doc)
+
+        # Index the embedding so later uploads can find this embryo. Without
+        # MongoDB the index key is returned as the analysis id instead, so
+        # the client can still resolve similarity hits to its uploads.
+        if embedding is not None:
+            if result.analysis_id is None:
+                result.analysis_id = uuid.uuid4().hex
+            _cache_result(result.analysis_id, payload)
+            index.add(result.analysis_id, embedding, digest=digests[idx])
 
     return results
@@ -0,0 +1,180 @@
+import gc
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+MODEL_FILENAME = "model.keras"  # <registry>/<version>/model.keras
+ACTIVE_FILENAME = "ACTIVE"  # <registry>/ACTIVE holds the version to serve after a restart
+LEGACY_VERSION = "legacy"  # the single pre-registry MODEL_PATH artifact
+
+
+@dataclass
+class ServingModel:
+    """
+    A loaded, warmed model version. Batches hold on to the instance they
+    started with, so a swap never changes the model under a running batch.
+    `embed_fn` is the forward pass without test-time augmentation.
+    """
+
+    version: str
+    model: Any
+    predict_fn: Callable
+    loaded_at: datetime
+    embed_fn: Optional[Callable] = None
+
+
+class ModelRegistry:
+    """
+    Local registry of versioned model artifacts with zero-downtime hot swap.
+
+    A version is loaded and warmed by `loader` on a background thread while
+    the current one keeps serving, then swapped in with a single reference
+    assignment. Only one load runs at a time and the registry keeps no
+    reference to replaced versions, so at most two models are resident.
+    """
+
+    def __init__(self, root: str, legacy_path: str, loader: Callable[[str, str], ServingModel]):
+        self.root = root
+        self.legacy_path = legacy_path
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._active: Optional[ServingModel] = None
+        self._loading: Optional[str] = None
+        self._started = False
+        self._first_load_done = threading.Event()
+        self.last_error: Optional[str] = None
+
+    def versions(self) -> Dict[str, str]:
+        """
+        Available versions mapped to their artifact path.
+        """
+        found: Dict[str, str] = {}
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                path = os.path.join(self.root, name, MODEL_FILENAME)
+                if os.path.isfile(path):
+                    found[name] = path
+        if os.path.isfile(self.legacy_path):
+            found.setdefault(LEGACY_VERSION, self.legacy_path)
+        return found
+
+    def _default_version(self, versions: Dict[str, str]) -> Optional[str]:
+        # The last activated version, else the newest artifact in the registry
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILENAME)) as f:
+                version = f.read().strip()
+            if version in versions:
+                return version
+        except OSError:
+            pass
+        registered = [v for v in versions if v != LEGACY_VERSION]
+        if registered:
+            return max(registered, key=lambda v: os.path.getmtime(versions[v]))
+        return LEGACY_VERSION if LEGACY_VERSION in versions else None
+
+    def start(self) -> None:
+        """
+        Begin loading the default version in the background (idempotent).
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        versions = self.versions()
+        version = self._default_version(versions)
+        if version is None:
+            print(f"No model found in {self.root} or at {self.legacy_path}.")
+            self._first_load_done.set()
+            return
+        self.activate(version)
+
+    def active(self) -> Optional[ServingModel]:
+        """
+        The version currently serving. Waits for the initial load on a cold
+        start; returns None if no version could be loaded.
+        """
+        if self._active is None:
+            self.start()
+            self._first_load_done.wait()
+        return self._active
+
+    def activate(self, version: str) -> None:
+        """
+        Load `version` in the background and swap it in once warmed.
+
+        Raises KeyError for unknown versions and RuntimeError while another
+        version is still loading.
+        """
+        path = self.versions().get(version)
+        if path is None:
+            raise KeyError(version)
+
+        with self._lock:
+            if self._loading is not None:
+                raise RuntimeError(f"Model version {self._loading} is still loading.")
+            self._loading = version
+            self._started = True
+
+        threading.Thread(
+            target=self._load_and_swap, args=(version, path), name=f"model-load-{version}", daemon=True
+        ).start()
+
+    def _load_and_swap(self, version: str, path: str) -> None:
+        try:
+            serving = self._loader(version, path)
+        except Exception as e:
+            print(f"Failed to load model version {version}: {e}")
+            serving = None
+            error = f"{version}: {e}"
+
+        with self._lock:
+            previous = self._active
+            if serving is not None:
+                # Atomic swap: new batches pick up `serving`, running ones
+                # finish on the instance they already hold.
+                self._active = serving
+                self.last_error = None
+            else:
+                self.last_error = error
+            self._loading = None
+        self._first_load_done.set()
+
+        if serving is not None:
+            self._write_active(version)
+            print(f"Model version {version} is now serving.")
+            if previous is not None:
+                # Drop the registry's reference; the old model is freed once
+                # the last batch using it returns.
+                del previous
+                gc.collect()
+
+    def _write_active(self, version: str) -> None:
+        if not os.path.isdir(self.root):
+            return
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILENAME), "w") as f:
+                f.write(version)
+        except OSError:
+            pass
+
+    def status(self) -> Dict[str, Any]:
+        active = self._active
+        versions: List[Dict[str, Any]] = [
+            {
+                "version": version,
+                "path": path,
+                "active": active is not None and active.version == version,
+                "loading": self._loading == version,
+            }
+            for version, path in self.versions().items()
+        ]
+        return {
+            "active_version": active.version if active else None,
+            "loaded_at": active.loaded_at if active else None,
+            "loading_version": self._loading,
+            "last_error": self.last_error,
+            "versions": versions,
+        }
@@ -0,0 +1,149 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # optional: approximate search for large collections
+except ImportError:
+    hnswlib = None
+
+
+# Switch from exact NumPy search to an HNSW index once the collection
+# reaches this size (only if hnswlib is installed).
+ANN_THRESHOLD = int(os.getenv("EMBRYO_ANN_THRESHOLD", "20000"))
+
+# Rows scored per matmul in exact search; bounds the float32 temporary.
+_SEARCH_CHUNK = 4096
+
+
+class EmbeddingIndex:
+    """
+    Cosine-similarity index over L2-normalised backbone embeddings.
+
+    Vectors live in one growable float16 array (4 KB per 2048-d embedding).
+    Search is a chunked matrix-vector product in NumPy; above ANN_THRESHOLD
+    entries an optional hnswlib index is used instead. Each entry may also
+    carry the SHA-256 digest of the uploaded bytes for exact-duplicate lookup.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._capacity = initial_capacity
+        self._vectors: Optional[np.ndarray] = None  # allocated on first add
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._digests: Dict[str, str] = {}
+        self._ann = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str, embedding: np.ndarray, digest: Optional[str] = None) -> None:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        with self._lock:
+            if key in self._rows:
+                return
+            if self._vectors is None:
+                self._vectors = np.empty((self._capacity, vector.shape[0]), dtype=np.float16)
+            row = len(self._keys)
+            if row == self._vectors.shape[0]:
+                grown = np.empty((2 * row, self._vectors.shape[1]), dtype=np.float16)
+                grown[:row] = self._vectors
+                self._vectors = grown
+            self._vectors[row] = vector
+            self._keys.append(key)
+            self._rows[key] = row
+            if digest is not None:
+                self._digests.setdefault(digest, key)
+            if self._ann is not None:
+                if row >= self._ann.get_max_elements():
+                    self._ann.resize_index(self._vectors.shape[0])
+                self._ann.add_items(vector[np.newaxis], np.array([row]))
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return self._vectors[row].astype(np.float32)
+
+    def lookup_digest(self, digest: str) -> Optional[str]:
+        """
+        Key of the first entry uploaded with exactly these bytes, if any.
+        """
+        with self._lock:
+            return self._digests.get(digest)
+
+    def search(self, embedding: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        The k most similar entries as (key, cosine similarity), best first.
+        """
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        # One extra hit so the excluded key can be dropped
+        wanted = k + (1 if exclude is not None else 0)
+
+        with self._lock:
+            n = len(self._keys)
+            if n == 0 or k <= 0:
+                return []
+            wanted = min(wanted, n)
+            if self._ann is None and hnswlib is not None and n >= ANN_THRESHOLD:
+                self._build_ann(n)
+            if self._ann is not None:
+                self._ann.set_ef(max(64, 2 * wanted))
+                labels, distances = self._ann.knn_query(query[np.newaxis], k=wanted)
+                # 'ip' distance is 1 - dot product
+                hits = [(self._keys[r], 1.0 - float(d)) for r, d in zip(labels[0], distances[0])]
+            else:
+                hits = self._exact_search(query, n, wanted)
+
+        return [(key, sim) for key, sim in hits if key != exclude][:k]
+
+    def _exact_search(self, query: np.ndarray, n: int, k: int) -> List[Tuple[str, float]]:
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _SEARCH_CHUNK):
+            stop = min(start + _SEARCH_CHUNK, n)
+            np.dot(self._vectors[start:stop].astype(np.float32), query, out=scores[start:stop])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._keys[r], float(scores[r])) for r in top]
+
+    def _build_ann(self, n: int) -> None:
+        ann = hnswlib.Index(space="ip", dim=self._vectors.shape[1])
+        ann.init_index(max_elements=self._vectors.shape[0], ef_construction=200, M=16)
+        ann.add_items(self._vectors[:n].astype(np.float32), np.arange(n))
+        self._ann = ann
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            n = len(self._keys)
+            vectors = self._vectors[:n] if self._vectors is not None else np.empty((0, 0), dtype=np.float16)
+            digests = np.array(list(self._digests.items()), dtype=str).reshape(-1, 2)
+            keys = np.array(self._keys, dtype=str)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=vectors, keys=keys, digests=digests)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            vectors, keys, digests = data["vectors"], data["keys"], data["digests"]
+        with self._lock:
+            self._capacity = max(self._capacity, len(keys))
+            self._vectors = None
+            self._keys, self._rows, self._digests, self._ann = [], {}, {}, None
+            if len(keys):
+                self._vectors = np.empty((self._capacity, vectors.shape[1]), dtype=np.float16)
+                self._vectors[: len(keys)] = vectors
+                self._keys = [str(k) for k in keys]
+                self._rows = {key: row for row, key in enumerate(self._keys)}
+                self._digests = {str(d): str(k) for d, k in digests}
@@ -2,6 +2,8 @@ from flask import Flask, jsonify, request
 from werkzeug.utils import secure_filename
 from typing import Any, Dict, List
 
+from app.db import ensure_indexes
+from app.services.admission import AdmissionRejected, admission
 from app.services.analysis import analyze_embryo_batch
 
 
@@ -14,13 +16,26 @@ def create_flask_app() -> Flask:
     not both, or use Flask only for legacy integration.
     """
     app = Flask(__name__)
+    ensure_indexes()
 
     @app.get("/flask/health")
     def health() -> Any:
         return jsonify({"status": "ok", "service": "embryo-xai-flask"})
 
+    @app.get("/flask/admission")
+    def admission_metrics() -> Any:
+        return jsonify(admission.metrics())
+
     @app.post("/flask/analyze")
     def analyze() -> Any:
+        # Shed before request.files parses (and buffers) the upload
+        if request.content_length is None:
+            return jsonify({"error": "A Content-Length header is required for uploads"}), 411
+        try:
+            admission.precheck(request.content_length)
+        except AdmissionRejected as e:
+            return jsonify({"error": e.detail}), e.status_code, e.headers
+
         if "files" not in request.files:
             return jsonify({"error": "No files uploaded under 'files' field"}), 400
 
@@ -29,20 +44,28 @@ def create_flask_app() -> Flask:
         if not uploaded_files:
             return jsonify({"error": "At least one file is required"}), 400
 
-        image_bytes_list: List[bytes] = []
-        for f in uploaded_files:
-            f.filename = secure_filename(f.filename)
-            content = f.read()
-            if not content:
-                return jsonify({"error": f"File {f.filename} is empty"}), 400
-            image_bytes_list.append(content)
+        try:
+            ticket = admission.acquire(len(uploaded_files))
+        except AdmissionRejected as e:
+            return jsonify({"error": e.detail}), e.status_code, e.headers
+
+        try:
+            image_bytes_list: List[bytes] = []
+            for f in uploaded_files:
+                f.filename = secure_filename(f.filename)
+                content = f.read()
+                if not content:
+                    return jsonify({"error": f"File {f.filename} is empty"}), 400
+                image_bytes_list.append(content)
 
-        meta: Dict[str, Any] = {
-            "maternal_age": request.form.get("maternal_age", type=int),
-            "fertilization_method": request.form.get("fertilization_method"),
-        }
+            meta: Dict[str, Any] = {
+                "maternal_age": request.form.get("maternal_age", type=int),
+                "fertilization_method": request.form.get("fertilization_method"),
+            }
 
-        results = analyze_embryo_batch(image_bytes_list, meta)
+            results = analyze_embryo_batch(image_bytes_list, meta)
+        finally:
+            admission.release(ticket)
         # Pydantic models -> dicts for JSON
         return jsonify([r.model_dump() for r in results])
 
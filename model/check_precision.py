@@ -0,0 +1,104 @@
+import tensorflow as tf
+import numpy as np
+import argparse
+import sys
+from model import build_multi_output_model, set_precision_policy, PRECISION_POLICIES
+from data_loader import BlastocystLoader
+from preprocessing import allocate_batch, read_image, resize_into
+
+HEADS = ['exp_output', 'icm_output', 'te_output']
+
+# Stated tolerance (in Gardner grade units) for the reduced-precision / XLA
+# model against the float32 reference on the validation split.
+DEFAULT_MEAN_TOLERANCE = 0.05
+DEFAULT_MAX_TOLERANCE = 0.25
+
+def _build(weights_path, precision):
+    set_precision_policy(precision)
+    model = build_multi_output_model()
+    model.load_weights(weights_path)
+    return model
+
+def _predict_fn(model, jit_compile):
+    @tf.function(jit_compile=jit_compile)
+    def predict(images):
+        return model(images, training=False)
+    return predict
+
+def check_precision(csv_path, img_dir, weights_path, precision='mixed_bfloat16', jit_compile=True,
+                    batch_size=32, mean_tolerance=DEFAULT_MEAN_TOLERANCE, max_tolerance=DEFAULT_MAX_TOLERANCE):
+    """
+    Compares predictions of the requested execution mode against the plain
+    float32 model on the validation split, one ordered pass over every
+    readable image. Returns True if the drift of every head stays within the
+    tolerance.
+    """
+    loader = BlastocystLoader(csv_path, img_dir, batch_size=batch_size)
+
+    reference = _predict_fn(_build(weights_path, 'float32'), jit_compile=False)
+    candidate = _predict_fn(_build(weights_path, precision), jit_compile=jit_compile)
+    # Leave the process in the default policy
+    set_precision_policy('float32')
+
+    drifts = {head: [] for head in HEADS}
+    batch = allocate_batch(batch_size)
+    n_batch = 0
+    skipped = 0
+
+    def flush(n):
+        images = tf.constant(batch[:n])
+        ref_preds = reference(images)
+        cand_preds = candidate(images)
+        for head, ref, cand in zip(HEADS, ref_preds, cand_preds):
+            diff = np.abs(np.asarray(ref, dtype=np.float32) - np.asarray(cand, dtype=np.float32))
+            drifts[head].append(diff.reshape(-1))
+
+    # Each validation image exactly once, in order (the training generator
+    # loops forever and reshuffles, so it cannot give a single pass)
+    for _, row in loader.val_df.iterrows():
+        img_path = loader.find_image(row['Image'])
+        img = read_image(img_path) if img_path is not None else None
+        if img is None:
+            skipped += 1
+            continue
+        resize_into(img, batch[n_batch])
+        n_batch += 1
+        if n_batch == batch_size:
+            flush(n_batch)
+            n_batch = 0
+    if n_batch:
+        flush(n_batch)
+
+    if not drifts[HEADS[0]]:
+        print("No readable validation images.")
+        return False
+
+    n_images = sum(len(d) for d in drifts[HEADS[0]])
+    print(f"Drift of {precision} (jit_compile={jit_compile}) vs float32 "
+          f"on {n_images} validation images ({skipped} missing or unreadable):")
+    ok = True
+    for head in HEADS:
+        diff = np.concatenate(drifts[head])
+        mean_drift = float(np.mean(diff))
+        max_drift = float(np.max(diff))
+        within = mean_drift <= mean_tolerance and max_drift <= max_tolerance
+        ok = ok and within
+        print(f"  {head}: mean={mean_drift:.4f} max={max_drift:.4f} "
+              f"(tolerance mean<={mean_tolerance}, max<={max_tolerance}) {'OK' if within else 'FAIL'}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--img_dir", required=True)
+    parser.add_argument("--weights", default="best_model.keras")
+    parser.add_argument("--precision", default="mixed_bfloat16", choices=PRECISION_POLICIES)
+    parser.add_argument("--no_jit", action="store_true", help="Disable XLA for the candidate model")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--mean_tolerance", type=float, default=DEFAULT_MEAN_TOLERANCE)
+    parser.add_argument("--max_tolerance", type=float, default=DEFAULT_MAX_TOLERANCE)
+    args = parser.parse_args()
+
+    ok = check_precision(args.csv, args.img_dir, args.weights, args.precision, not args.no_jit,
+                         args.batch_size, args.mean_tolerance, args.max_tolerance)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,157 @@
+import tensorflow as tf
+import numpy as np
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import KFold
+from model import build_multi_output_model, set_precision_policy, PRECISION_POLICIES
+from data_loader import BlastocystLoader, cached_data_generator
+
+HEADS = ['exp', 'icm', 'te']
+
+# Two-sided 95% Student-t critical values by degrees of freedom
+_T_975 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+          9: 2.262, 10: 2.228, 15: 2.131, 20: 2.086, 30: 2.042}
+
+def _t_critical(df):
+    for d in sorted(_T_975, reverse=True):
+        if df >= d:
+            return _T_975[d] if df <= 30 else 1.96
+    return float('nan')
+
+def _run_fold(fold, train_idx, val_idx, images_path, labels_path, epochs, batch_size,
+              threads, precision, jit_compile):
+    """
+    Trains and evaluates one fold. Runs in a worker process: images are
+    memory-mapped from the shared cache, never decoded again.
+    """
+    start = time.perf_counter()
+    # Split the CPU between workers instead of every worker grabbing all cores
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    images = np.load(images_path, mmap_mode='r')
+    labels = np.load(labels_path)
+
+    set_precision_policy(precision)
+    model = build_multi_output_model()
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+        loss={'exp_output': 'mse', 'icm_output': 'mse', 'te_output': 'mse'},
+        jit_compile=jit_compile
+    )
+    model.fit(
+        cached_data_generator(images, labels, train_idx, batch_size),
+        steps_per_epoch=max(1, len(train_idx) // batch_size),
+        epochs=epochs,
+        verbose=0
+    )
+    train_seconds = time.perf_counter() - start
+
+    val_idx = np.sort(val_idx)
+    abs_errors = {head: [] for head in HEADS}
+    for i in range(0, len(val_idx), batch_size):
+        batch_idx = val_idx[i:i+batch_size]
+        preds = model.predict_on_batch(images[batch_idx])
+        for h, head in enumerate(HEADS):
+            abs_errors[head].append(np.abs(np.asarray(preds[h]).reshape(-1) - labels[batch_idx, h]))
+
+    return {
+        'fold': fold,
+        'n_train': int(len(train_idx)),
+        'n_val': int(len(val_idx)),
+        'mae': {head: float(np.mean(np.concatenate(abs_errors[head]))) for head in HEADS},
+        'train_seconds': train_seconds,
+        'wall_seconds': time.perf_counter() - start,
+    }
+
+def _aggregate(fold_results):
+    k = len(fold_results)
+    summary = {}
+    for head in HEADS:
+        values = np.array([r['mae'][head] for r in fold_results])
+        std = float(np.std(values, ddof=1)) if k > 1 else 0.0
+        half_width = _t_critical(k - 1) * std / math.sqrt(k) if k > 1 else float('nan')
+        summary[head] = {
+            'mean_mae': float(np.mean(values)),
+            'std_mae': std,
+            'ci95': [float(np.mean(values) - half_width), float(np.mean(values) + half_width)],
+        }
+    return summary
+
+def cross_validate(csv_path, img_dir, folds=5, workers=None, epochs=10, batch_size=32,
+                   cache_dir='.cache', seed=42, precision='float32', jit_compile=False,
+                   output='cv_summary.json'):
+    """
+    K-fold cross-validation with folds trained in parallel worker processes.
+
+    Every image is decoded once into a shared uint8 cache that workers
+    memory-map; per-head MAE is aggregated into mean, std and a 95% CI.
+    """
+    start = time.perf_counter()
+    loader = BlastocystLoader(csv_path, img_dir, batch_size=batch_size)
+    images_path, labels_path = loader.build_image_cache(cache_dir)
+    n_samples = len(np.load(labels_path))
+    if n_samples < folds:
+        raise ValueError(f"Only {n_samples} readable images for {folds} folds.")
+
+    # Fetch the ImageNet weights once so workers do not race on the download
+    tf.keras.applications.ResNet50V2(weights='imagenet', include_top=False)
+    tf.keras.backend.clear_session()
+
+    cpus = os.cpu_count() or 1
+    workers = workers or min(folds, cpus)
+    threads = max(1, cpus // workers)
+
+    splits = KFold(n_splits=folds, shuffle=True, random_state=seed).split(np.arange(n_samples))
+    # TF is not fork-safe: start workers with 'spawn'
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_run_fold, fold, train_idx, val_idx, images_path, labels_path,
+                        epochs, batch_size, threads, precision, jit_compile)
+            for fold, (train_idx, val_idx) in enumerate(splits)
+        ]
+        fold_results = [f.result() for f in futures]
+
+    summary = {
+        'config': {'folds': folds, 'workers': workers, 'threads_per_worker': threads, 'epochs': epochs,
+                   'batch_size': batch_size, 'seed': seed, 'precision': precision, 'jit_compile': jit_compile},
+        'n_samples': n_samples,
+        'heads': _aggregate(fold_results),
+        'folds': fold_results,
+        'wall_seconds': time.perf_counter() - start,
+    }
+    with open(output, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    for r in fold_results:
+        print(f"Fold {r['fold']}: MAE EXP={r['mae']['exp']:.4f} ICM={r['mae']['icm']:.4f} "
+              f"TE={r['mae']['te']:.4f} ({r['wall_seconds']:.1f}s)")
+    for head, stats in summary['heads'].items():
+        print(f"MAE {head.upper()}: {stats['mean_mae']:.4f} +/- {stats['std_mae']:.4f} "
+              f"(95% CI {stats['ci95'][0]:.4f}-{stats['ci95'][1]:.4f})")
+    print(f"Total wall-clock: {summary['wall_seconds']:.1f}s. Summary written to {output}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--img_dir", required=True)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel fold processes (default: min(folds, CPUs))")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--cache_dir", default=".cache", help="Where the decoded image cache is kept")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--precision", default="float32", choices=PRECISION_POLICIES)
+    parser.add_argument("--jit_compile", action="store_true")
+    parser.add_argument("--output", default="cv_summary.json")
+    args = parser.parse_args()
+
+    cross_validate(args.csv, args.img_dir, args.folds, args.workers, args.epochs, args.batch_size,
+                   args.cache_dir, args.seed, args.precision, args.jit_compile, args.output)
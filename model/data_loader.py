@@ -2,16 +2,20 @@ import pandas as pd
 import numpy as np
 import tensorflow as tf
 import os
-import cv2
+import hashlib
+from preprocessing import TARGET_SIZE, allocate_batch, read_image, resize_into
 
 class BlastocystLoader:
-    def __init__(self, csv_path, img_dir, batch_size=32, target_size=(224, 224), validation_split=0.2, augment=False):
+    def __init__(self, csv_path, img_dir, batch_size=32, target_size=TARGET_SIZE, validation_split=0.2, augment=False):
         self.csv_path = csv_path
         self.img_dir = img_dir
         self.batch_size = batch_size
         self.target_size = target_size
         self.augment = augment
         
+        # Per-split counters, read (and reset) by the training profiler
+        self.stats = {'train': self._new_stats(), 'val': self._new_stats()}
+        
         # Load and clean data
         self.df = self._load_data()
         
@@ -26,6 +30,18 @@ class BlastocystLoader:
         print(f"Training samples: {len(self.train_df)}")
         print(f"Validation samples: {len(self.val_df)}")
         
+    @staticmethod
+    def _new_stats():
+        return {'images_decoded': 0, 'missing_files': 0, 'decode_errors': 0}
+    
+    def reset_stats(self):
+        """
+        Returns the counters collected since the last reset and starts new ones.
+        """
+        stats = self.stats
+        self.stats = {split: self._new_stats() for split in stats}
+        return stats
+
     def _load_data(self):
         df = pd.read_csv(self.csv_path, sep=';') # CSV uses semi-colon separator
         df.columns = df.columns.str.strip() # Handle whitespace
@@ -55,7 +71,70 @@ class BlastocystLoader:
             
         return df
 
-    def data_generator(self, dataframe):
+    def find_image(self, img_name):
+        img_path = os.path.join(self.img_dir, img_name)
+        if os.path.exists(img_path):
+            return img_path
+        # Try searching recursively if structure is complex or just skip
+        for root, dirs, files in os.walk(self.img_dir):
+            if img_name in files:
+                return os.path.join(root, img_name)
+        return None
+
+    def build_image_cache(self, cache_dir):
+        """
+        Decodes every image of self.df once into a uint8 array on disk.
+
+        Returns paths to (images.npy, labels.npy): images of shape (N, H, W, 3)
+        and float32 labels of shape (N, 3) in EXP/ICM/TE order, for the rows
+        whose image could be read. Open the images with np.load(mmap_mode='r')
+        to share one copy between processes. An existing cache for the same
+        CSV, image directory and target size is reused.
+        """
+        stat = os.stat(self.csv_path)
+        key = f"{os.path.abspath(self.csv_path)}|{stat.st_size}|{stat.st_mtime}|{os.path.abspath(self.img_dir)}|{self.target_size}"
+        cache_dir = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest()[:16])
+        images_path = os.path.join(cache_dir, 'images.npy')
+        labels_path = os.path.join(cache_dir, 'labels.npy')
+        if os.path.exists(images_path) and os.path.exists(labels_path):
+            print(f"Reusing image cache {cache_dir}")
+            return images_path, labels_path
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        exp_col = [c for c in self.df.columns if 'EXP' in c][0]
+        icm_col = [c for c in self.df.columns if 'ICM' in c][0]
+        te_col =  [c for c in self.df.columns if 'TE'  in c][0]
+        
+        width, height = self.target_size
+        tmp_path = images_path + '.tmp'
+        images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(self.df), height, width, 3))
+        labels = []
+        n_images = 0
+        for _, row in self.df.iterrows():
+            img_path = self.find_image(row['Image'])
+            img = read_image(img_path) if img_path is not None else None
+            if img is None:
+                continue
+            resize_into(img, images[n_images])
+            labels.append((row[exp_col], row[icm_col], row[te_col]))
+            n_images += 1
+        images.flush()
+        del images
+        
+        # Trim rows whose image was missing or unreadable
+        if n_images < len(self.df):
+            full = np.load(tmp_path, mmap_mode='r')
+            trimmed = np.lib.format.open_memmap(images_path + '.trim', mode='w+', dtype=np.uint8, shape=(n_images,) + full.shape[1:])
+            trimmed[:] = full[:n_images]
+            trimmed.flush()
+            del trimmed, full
+            os.replace(images_path + '.trim', tmp_path)
+        np.save(labels_path, np.asarray(labels, dtype=np.float32).reshape(-1, 3))
+        os.replace(tmp_path, images_path)
+        print(f"Cached {n_images}/{len(self.df)} images in {cache_dir}")
+        return images_path, labels_path
+
+    def data_generator(self, dataframe, split='train'):
         while True:
             # Shuffle every epoch
             dataframe = dataframe.sample(frac=1).reset_index(drop=True)
@@ -63,7 +142,9 @@ class BlastocystLoader:
             for i in range(0, len(dataframe), self.batch_size):
                 batch_df = dataframe.iloc[i:i+self.batch_size]
                 
-                images = []
+                # Frames are resized straight into this uint8 buffer
+                images = allocate_batch(len(batch_df), self.target_size)
+                n_images = 0
                 # Targets
                 exp_labels = []
                 icm_labels = []
@@ -73,29 +154,19 @@ class BlastocystLoader:
                 
                 for idx, row in batch_df.iterrows():
                     img_name = row['Image']
-                    img_path = os.path.join(self.img_dir, img_name)
-                    
-                    if not os.path.exists(img_path):
-                        # Try searching recursively if structure is complex or just skip
-                        found = False
-                        for root, dirs, files in os.walk(self.img_dir):
-                            if img_name in files:
-                                img_path = os.path.join(root, img_name)
-                                found = True
-                                break
-                        if not found:
-                            continue
+                    img_path = self.find_image(img_name)
+                    if img_path is None:
+                        self.stats[split]['missing_files'] += 1
+                        continue
                             
                     try:
-                        img = cv2.imread(img_path)
+                        img = read_image(img_path)
                         if img is None:
+                            self.stats[split]['decode_errors'] += 1
                             continue
                         
-                        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                        img = cv2.resize(img, self.target_size)
-                        img = img.astype(np.float32) / 255.0
-                        
-                        images.append(img)
+                        resize_into(img, images[n_images])
+                        self.stats[split]['images_decoded'] += 1
                         
                         # Identify columns based on naming convention in CSV
                         # Assumes format like EXP_silver, ICM_silver...
@@ -106,15 +177,17 @@ class BlastocystLoader:
                         exp_labels.append(row[exp_col])
                         icm_labels.append(row[icm_col])
                         te_labels.append(row[te_col])
+                        n_images += 1
                         
                     except Exception as e:
                         print(f"Error loading {img_name}: {e}")
+                        self.stats[split]['decode_errors'] += 1
                         continue
 
-                if not images:
+                if not n_images:
                     continue
                     
-                images = np.array(images)
+                images = images[:n_images]
                 
                 # Output dictionary for multi-output model
                 # shape: (batch_size,)
@@ -130,9 +203,27 @@ class BlastocystLoader:
         return self.data_generator(self.train_df)
     
     def get_val_dataset(self):
-        return self.data_generator(self.val_df)
+        return self.data_generator(self.val_df, split='val')
         
     def get_steps_per_epoch(self, split='train'):
         if split == 'train':
             return len(self.train_df) // self.batch_size
         return len(self.val_df) // self.batch_size
+
+def cached_data_generator(images, labels, indices, batch_size, shuffle=True):
+    """
+    Batches rows `indices` of a cached uint8 image array (see
+    BlastocystLoader.build_image_cache); only the current batch is copied.
+    """
+    indices = np.asarray(indices)
+    while True:
+        order = np.random.permutation(indices) if shuffle else indices
+        for i in range(0, len(order), batch_size):
+            # Sorted reads are sequential on the memory-mapped file
+            batch_idx = np.sort(order[i:i+batch_size])
+            y = {
+                'exp_output': labels[batch_idx, 0],
+                'icm_output': labels[batch_idx, 1],
+                'te_output':  labels[batch_idx, 2]
+            }
+            yield images[batch_idx], y
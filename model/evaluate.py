@@ -4,13 +4,29 @@ import tensorflow as tf
 from model import build_multi_output_model
 import argparse
 import os
-import cv2
+from preprocessing import allocate_batch, read_image, resize_into
+from tta import augment_batch, parse_transforms, reduce_views
 
-def evaluate(csv_path, img_dir, weights_path):
+def evaluate(csv_path, img_dir, weights_path, batch_size=32, tta=''):
     print(f"Loading weights from {weights_path}...")
     model = build_multi_output_model()
     model.load_weights(weights_path)
     
+    # Test-time augmentation: all views of a batch in one forward pass,
+    # reduced to the per-head mean (scored) and variance (reported)
+    transforms = parse_transforms(tta)
+    n_views = len(transforms)
+    
+    @tf.function
+    def predict(images):
+        if n_views > 1:
+            images = augment_batch(images, transforms)
+        preds = model(images, training=False)
+        heads = tf.concat([tf.cast(p, tf.float32) for p in preds], axis=1)
+        if n_views > 1:
+            return reduce_views(heads, n_views)
+        return heads, tf.zeros_like(heads)
+    
     print(f"Reading CSV from {csv_path}...")
     try:
         df = pd.read_csv(csv_path, sep=';')
@@ -43,6 +59,23 @@ def evaluate(csv_path, img_dir, weights_path):
     print(f"Evaluated on {len(df)} samples (dropped {original_len - len(df)})")
     
     maes = {'exp': [], 'icm': [], 'te': []}
+    variances = []
+    
+    # Frames are resized straight into a reused uint8 batch buffer and
+    # predicted batch_size at a time.
+    batch = allocate_batch(batch_size)
+    batch_targets = []
+    
+    def flush():
+        n = len(batch_targets)
+        preds, var = predict(tf.constant(batch[:n]))
+        preds = preds.numpy()
+        variances.append(var.numpy())
+        for i, (exp_true, icm_true, te_true) in enumerate(batch_targets):
+            maes['exp'].append(abs(preds[i][0] - exp_true))
+            maes['icm'].append(abs(preds[i][1] - icm_true))
+            maes['te'].append(abs(preds[i][2] - te_true))
+        batch_targets.clear()
     
     for idx, row in df.iterrows():
         img_name = row['Image']
@@ -53,32 +86,22 @@ def evaluate(csv_path, img_dir, weights_path):
             continue
             
         try:
-            img = cv2.imread(img_path)
+            img = read_image(img_path)
             if img is None:
                 continue
             
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (224, 224))
-            img = img.astype(np.float32) / 255.0
-            img = np.expand_dims(img, axis=0)
-            
-            preds = model.predict(img, verbose=0)
-            
-            exp_pred = preds[0][0][0]
-            icm_pred = preds[1][0][0]
-            te_pred = preds[2][0][0]
-            
-            exp_true = row[exp_col]
-            icm_true = row[icm_col]
-            te_true  = row[te_col]
-            
-            maes['exp'].append(abs(exp_pred - exp_true))
-            maes['icm'].append(abs(icm_pred - icm_true))
-            maes['te'].append(abs(te_pred - te_true))
+            resize_into(img, batch[len(batch_targets)])
+            batch_targets.append((row[exp_col], row[icm_col], row[te_col]))
             
         except Exception as e:
             print(f"Error processing {img_name}: {e}")
             continue
+        
+        if len(batch_targets) == batch_size:
+            flush()
+    
+    if batch_targets:
+        flush()
 
     if not maes['exp']:
         print("No samples evaluated.")
@@ -88,12 +111,18 @@ def evaluate(csv_path, img_dir, weights_path):
     print(f"MAE Expansion: {np.mean(maes['exp']):.4f}")
     print(f"MAE ICM: {np.mean(maes['icm']):.4f}")
     print(f"MAE TE: {np.mean(maes['te']):.4f}")
+    if n_views > 1:
+        mean_var = np.mean(np.concatenate(variances), axis=0)
+        print(f"TTA ({', '.join(transforms)}) mean variance: "
+              f"EXP={mean_var[0]:.4f}, ICM={mean_var[1]:.4f}, TE={mean_var[2]:.4f}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--csv", required=True)
     parser.add_argument("--img_dir", required=True)
     parser.add_argument("--weights", default="best_model.keras")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--tta", default="", help="Comma-separated test-time augmentations, e.g. flip_h,flip_v,rot90")
     args = parser.parse_args()
     
-    evaluate(args.csv, args.img_dir, args.weights)
+    evaluate(args.csv, args.img_dir, args.weights, args.batch_size, args.tta)
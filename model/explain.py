@@ -9,6 +9,7 @@ import os
 
 # We need to recreate the model structure exactly as in training
 from model import build_multi_output_model
+from preprocessing import load_batch, read_image
 
 def get_gradcam_heatmap(model, img_array, target_head_name, last_conv_layer_name):
     print(f"Generating Grad-CAM for head: {target_head_name} using layer: {last_conv_layer_name}")
@@ -39,9 +40,8 @@ def get_gradcam_heatmap(model, img_array, target_head_name, last_conv_layer_name
     heatmap = tf.maximum(heatmap, 0) / tf.math.reduce_max(heatmap)
     return heatmap.numpy()
 
-def save_visualization(img_path, heatmap, output_path="explanation.png"):
-    img = cv2.imread(img_path)
-    img = cv2.resize(img, (224, 224))
+def save_visualization(img, heatmap, output_path="explanation.png"):
+    # img: the preprocessed BGR uint8 frame (224x224)
     
     # Resize heatmap to match image size
     heatmap = cv2.resize(heatmap, (224, 224))
@@ -64,14 +64,12 @@ def explain(image_path, weights_path, head='exp_output'):
     else:
         print(f"Weights file {weights_path} not found. Using untrained weights.")
 
-    img = cv2.imread(image_path)
+    img = read_image(image_path)
     if img is None:
         print(f"Could not load image {image_path}")
         return
 
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = cv2.resize(img, (224, 224))
-    img_array = np.expand_dims(img.astype(np.float32) / 255.0, axis=0)
+    img_array = load_batch([img])
 
     # Identify last conv layer
     # For ResNet50V2, 'post_relu' is common.
@@ -90,7 +88,7 @@ def explain(image_path, weights_path, head='exp_output'):
                 break
     
     heatmap = get_gradcam_heatmap(model, img_array, head, layer_name)
-    save_visualization(image_path, heatmap)
+    save_visualization(img_array[0], heatmap)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -1,17 +1,59 @@
 import tensorflow as tf
 from tensorflow.keras import layers, models, applications
 
+# Precision policies supported for training and serving.
+# 'mixed_bfloat16' runs convolutions/matmuls in bfloat16 while keeping
+# variables in float32; the output heads always stay in float32.
+PRECISION_POLICIES = ('float32', 'mixed_bfloat16')
+
+
+def set_precision_policy(policy='float32'):
+    """
+    Sets the global Keras dtype policy. Must be called before the model is built.
+    """
+    if policy not in PRECISION_POLICIES:
+        raise ValueError(f"Unsupported precision policy '{policy}'. Choose one of {PRECISION_POLICIES}.")
+    tf.keras.mixed_precision.set_global_policy(policy)
+
+
+def add_input_preprocessing(inputs):
+    """
+    Folds input rescaling into the graph: uint8 frames (as decoded by
+    OpenCV) are rescaled to [0, 1]. The BGR channel order is handled by
+    fold_bgr_to_rgb on the first convolution, so no weighted layer is added
+    in front of the backbone (its ImageNet weights load layer by layer).
+    """
+    return layers.Rescaling(1.0 / 255, name='rescale')(inputs)
+
+
+def fold_bgr_to_rgb(base_model):
+    """
+    Makes the ImageNet (RGB) backbone accept BGR input by reversing the
+    input-channel axis of its first convolution kernel.
+    """
+    conv = base_model.get_layer('conv1_conv')
+    weights = conv.get_weights()
+    weights[0] = weights[0][:, :, ::-1, :]
+    conv.set_weights(weights)
+
+
 def build_multi_output_model(input_shape=(224, 224, 3)):
     """
     Builds a Multi-Output CNN for Gardner Grading.
+    Takes uint8 BGR frames of `input_shape` (see preprocessing.py).
     """
     
+    inputs = layers.Input(shape=input_shape, dtype='uint8', name='image')
+    
     # Backbone: ResNet50V2
     base_model = applications.ResNet50V2(
         weights='imagenet', 
         include_top=False, 
+        input_tensor=add_input_preprocessing(inputs),
         input_shape=input_shape
     )
+    # Frames arrive in OpenCV's BGR order
+    fold_bgr_to_rgb(base_model)
     
     # Freeze initial layers
     base_model.trainable = False
@@ -20,23 +62,26 @@ def build_multi_output_model(input_shape=(224, 224, 3)):
     x = base_model.output
     x = layers.GlobalAveragePooling2D()(x)
     x = layers.Dropout(0.5)(x)
+
+    # Output layers are pinned to float32 so regression outputs (and losses)
+    # stay numerically stable under the mixed_bfloat16 policy.
     
     # Head 1: Expansion Score (EXP)
     # Regression or Ordinal Classification
     exp_features = layers.Dense(128, activation='relu')(x)
-    exp_output = layers.Dense(1, activation='linear', name='exp_output')(exp_features)
+    exp_output = layers.Dense(1, activation='linear', dtype='float32', name='exp_output')(exp_features)
     
     # Head 2: Inner Cell Mass (ICM)
     icm_features = layers.Dense(128, activation='relu')(x)
-    icm_output = layers.Dense(1, activation='linear', name='icm_output')(icm_features)
+    icm_output = layers.Dense(1, activation='linear', dtype='float32', name='icm_output')(icm_features)
     
     # Head 3: Trophectoderm (TE)
     te_features = layers.Dense(128, activation='relu')(x)
-    te_output = layers.Dense(1, activation='linear', name='te_output')(te_features)
+    te_output = layers.Dense(1, activation='linear', dtype='float32', name='te_output')(te_features)
     
     # Combined Model
     model = models.Model(
-        inputs=base_model.input, 
+        inputs=inputs, 
         outputs=[exp_output, icm_output, te_output]
     )
     
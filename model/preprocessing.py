@@ -0,0 +1,66 @@
+import numpy as np
+import cv2
+
+# Shared preprocessing for training, evaluation, explanation and serving.
+#
+# Frames stay in OpenCV's native BGR uint8 layout end to end: they are decoded,
+# resized straight into a preallocated uint8 batch buffer, and handed to the
+# model as-is. Rescaling to [0, 1] happens inside the graph and the channel
+# order is folded into the first convolution (see add_input_preprocessing and
+# fold_bgr_to_rgb in model.py), so there are no per-step
+# full-size temporaries and no float32 copy four times the size of the frame.
+
+TARGET_SIZE = (224, 224)  # (width, height), as passed to cv2.resize
+
+def decode_image(image_bytes):
+    """
+    Decodes encoded image bytes into a BGR uint8 frame. Returns None if undecodable.
+    """
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def read_image(path):
+    """
+    Reads an image file into a BGR uint8 frame. Returns None if unreadable.
+    """
+    return cv2.imread(path, cv2.IMREAD_COLOR)
+
+def allocate_batch(batch_size, target_size=TARGET_SIZE):
+    """
+    Allocates an uninitialised uint8 batch buffer of shape (N, H, W, 3).
+    """
+    width, height = target_size
+    return np.empty((batch_size, height, width, 3), dtype=np.uint8)
+
+def resize_into(frame, out):
+    """
+    Resizes a BGR uint8 frame directly into `out`, one slot of a batch buffer.
+    """
+    height, width = out.shape[:2]
+    cv2.resize(frame, (width, height), dst=out)
+    return out
+
+def load_batch(frames, target_size=TARGET_SIZE):
+    """
+    Resizes already-decoded frames into a freshly allocated uint8 batch.
+    """
+    batch = allocate_batch(len(frames), target_size)
+    for i, frame in enumerate(frames):
+        resize_into(frame, batch[i])
+    return batch
+
+def expects_uint8(model):
+    """
+    True for models built with the in-graph preprocessing (uint8 input).
+    """
+    return 'uint8' in str(model.inputs[0].dtype)
+
+def to_model_input(batch, model):
+    """
+    Returns the uint8 BGR batch in the form `model` expects.
+
+    Models built by build_multi_output_model take it unchanged. Models saved
+    before preprocessing moved into the graph expect RGB float32 in [0, 1].
+    """
+    if expects_uint8(model):
+        return batch
+    return np.multiply(batch[..., ::-1], np.float32(1.0 / 255.0), dtype=np.float32)
@@ -0,0 +1,166 @@
+import tensorflow as tf
+import numpy as np
+import json
+import sys
+import time
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+def host_peak_rss_mb():
+    """
+    High-water mark of this process's resident memory in MB (None if unsupported).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class _LoaderTimer:
+    """
+    Records how long each batch of a wrapped generator takes to produce
+    and how many images it holds.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = 0.0
+        self.batches = 0
+        self.images = 0
+
+    def wrap(self, generator):
+        # A real generator (not just an iterator), as model.fit expects
+        while True:
+            start = time.perf_counter()
+            images, labels = next(generator)
+            self.seconds += time.perf_counter() - start
+            self.batches += 1
+            self.images += len(images)
+            yield images, labels
+
+class TrainingProfiler(tf.keras.callbacks.Callback):
+    """
+    Separates input-pipeline time from model time during model.fit.
+
+    Keras pulls the next batch inside its train step (or on a prefetch
+    thread), so the input wait of a step is the time spent in next() on the
+    wrapped generator between the end of the previous step and the end of
+    this one; compute is the rest of the step. When Keras prefetches, part of
+    the generator time overlaps the previous step and no longer stalls it, so
+    the wait is capped at the step time and the split is approximate: a high
+    input_wait_fraction still means the loader cannot keep up.
+
+    Per epoch it adds images/sec, the time spent inside the data generator,
+    the loader's counters (images decoded, missing files, decode errors) and
+    the host memory high-water mark. The summary is rewritten as JSON after
+    every epoch so interrupted runs still leave a comparable file.
+
+    Optionally captures a TF profiler trace for global steps [start, stop].
+    """
+    def __init__(self, loader, train_gen, summary_path='profile_summary.json',
+                 trace_steps=None, trace_dir='logs/profile', config=None):
+        super().__init__()
+        self.loader = loader
+        self._timer = _LoaderTimer()
+        self.train_gen = self._timer.wrap(train_gen)
+        self.summary_path = summary_path
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+        self.config = config or {}
+        self.epochs = []
+        self._global_step = 0
+        self._tracing = False
+        # Counters start here, just before model.fit: Keras already pulls the
+        # first batch while building its dataset, before any callback runs, so
+        # those pre-fit batches count toward epoch 0. Each epoch's counters are
+        # then reset in on_epoch_end.
+        self.loader.reset_stats()
+
+    def on_train_begin(self, logs=None):
+        self._train_start = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._last_step_end = self._epoch_start
+        # Generator time before the epoch started is not a stall of its steps
+        self._last_loader_seconds = self._timer.seconds
+        self._waits = []
+        self._computes = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.trace_steps and self._global_step == self.trace_steps[0]:
+            tf.profiler.experimental.start(self.trace_dir)
+            self._tracing = True
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        step = now - self._last_step_end
+        loader_seconds = self._timer.seconds
+        wait = min(loader_seconds - self._last_loader_seconds, step)
+        self._waits.append(wait)
+        self._computes.append(step - wait)
+        self._last_step_end = now
+        self._last_loader_seconds = loader_seconds
+        if self._tracing and self._global_step >= self.trace_steps[1]:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+        self._global_step += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        wait = float(np.sum(self._waits))
+        compute = float(np.sum(self._computes))
+        step_times = np.add(self._waits, self._computes)
+        images = self._timer.images
+        loader_seconds = self._timer.seconds
+        self._timer.reset()
+        self.epochs.append({
+            'epoch': epoch,
+            'steps': len(step_times),
+            'epoch_seconds': time.perf_counter() - self._epoch_start,
+            'input_wait_seconds': wait,
+            'compute_seconds': compute,
+            'input_wait_fraction': wait / (wait + compute) if wait + compute > 0 else 0.0,
+            'step_seconds_p50': float(np.percentile(step_times, 50)) if step_times.size else None,
+            'step_seconds_p95': float(np.percentile(step_times, 95)) if step_times.size else None,
+            # Images produced by the generator since the previous epoch ended
+            # (for epoch 0, since the profiler was created); Keras may
+            # prefetch a few batches ahead, so this can lead the step count.
+            'images': images,
+            'images_per_second': images / (wait + compute) if wait + compute > 0 else None,
+            'loader_seconds': loader_seconds,
+            'loader': self.loader.reset_stats(),
+            'host_peak_rss_mb': host_peak_rss_mb(),
+            'logs': {k: float(v) for k, v in (logs or {}).items()},
+        })
+        self._write_summary()
+
+    def on_train_end(self, logs=None):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+        self._write_summary()
+
+    def _write_summary(self):
+        wait = sum(e['input_wait_seconds'] for e in self.epochs)
+        compute = sum(e['compute_seconds'] for e in self.epochs)
+        images = sum(e['images'] for e in self.epochs)
+        summary = {
+            'config': self.config,
+            'trace_steps': list(self.trace_steps) if self.trace_steps else None,
+            'total': {
+                'wall_seconds': time.perf_counter() - self._train_start,
+                'input_wait_seconds': wait,
+                'compute_seconds': compute,
+                'input_wait_fraction': wait / (wait + compute) if wait + compute > 0 else 0.0,
+                'images': images,
+                'images_per_second': images / (wait + compute) if wait + compute > 0 else None,
+                'host_peak_rss_mb': host_peak_rss_mb(),
+            },
+            'epochs': self.epochs,
+        }
+        with open(self.summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -1,10 +1,12 @@
 import tensorflow as tf
 import os
 import argparse
-from model import build_multi_output_model
+from model import build_multi_output_model, set_precision_policy, PRECISION_POLICIES
 from data_loader import BlastocystLoader
+from profiling import TrainingProfiler
 
-def train(csv_path, img_dir, epochs=10, batch_size=32):
+def train(csv_path, img_dir, epochs=10, batch_size=32, jit_compile=False, precision='float32',
+          profile=False, profile_summary='profile_summary.json', trace_steps=None, trace_dir='logs/profile'):
     # Data Loader
     loader = BlastocystLoader(csv_path, img_dir, batch_size=batch_size)
     
@@ -15,6 +17,8 @@ def train(csv_path, img_dir, epochs=10, batch_size=32):
     validation_steps = loader.get_steps_per_epoch('val')
     
     # Model build
+    # The dtype policy must be in place before any layer is created.
+    set_precision_policy(precision)
     model = build_multi_output_model()
     
     # Compile
@@ -30,7 +34,9 @@ def train(csv_path, img_dir, epochs=10, batch_size=32):
             'exp_output': 'mae',
             'icm_output': 'mae',
             'te_output': 'mae'
-        }
+        },
+        # XLA fuses the ResNet blocks and the Dense heads into fewer kernels
+        jit_compile=jit_compile
     )
     
     model.summary()
@@ -44,6 +50,24 @@ def train(csv_path, img_dir, epochs=10, batch_size=32):
         except RuntimeError as e:
             print(e)
 
+    callbacks = [
+        tf.keras.callbacks.ModelCheckpoint('best_model.keras', save_best_only=True),
+        tf.keras.callbacks.EarlyStopping(patience=5, restore_best_weights=True)
+    ]
+    
+    # Optional profiling: input wait vs compute per step, loader statistics
+    if profile:
+        profiler = TrainingProfiler(
+            loader, train_gen,
+            summary_path=profile_summary,
+            trace_steps=trace_steps,
+            trace_dir=trace_dir,
+            config={'epochs': epochs, 'batch_size': batch_size,
+                    'jit_compile': jit_compile, 'precision': precision}
+        )
+        train_gen = profiler.train_gen
+        callbacks.insert(0, profiler)
+
     # Train
     history = model.fit(
         train_gen,
@@ -51,10 +75,7 @@ def train(csv_path, img_dir, epochs=10, batch_size=32):
         validation_data=val_gen,
         validation_steps=validation_steps,
         epochs=epochs,
-        callbacks=[
-            tf.keras.callbacks.ModelCheckpoint('best_model.keras', save_best_only=True),
-            tf.keras.callbacks.EarlyStopping(patience=5, restore_best_weights=True)
-        ]
+        callbacks=callbacks
     )
     
     return history
@@ -65,4 +86,20 @@ if __name__ == "__main__":
     CSV_PATH = "../blastocyst/Gardner_train_silver.csv"
     IMG_DIR = "../blastocyst/Images"
     
-    train(CSV_PATH, IMG_DIR)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--img_dir", default=IMG_DIR)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--jit_compile", action="store_true", help="Compile train/predict steps with XLA")
+    parser.add_argument("--precision", default="float32", choices=PRECISION_POLICIES)
+    parser.add_argument("--profile", action="store_true", help="Record input-pipeline vs compute timings")
+    parser.add_argument("--profile_summary", default="profile_summary.json", help="JSON summary written by --profile")
+    parser.add_argument("--trace_steps", default=None, help="Capture a TF profiler trace for steps START,STOP (with --profile)")
+    parser.add_argument("--trace_dir", default="logs/profile")
+    args = parser.parse_args()
+    
+    trace_steps = tuple(int(s) for s in args.trace_steps.split(",")) if args.trace_steps else None
+    
+    train(args.csv, args.img_dir, args.epochs, args.batch_size, args.jit_compile, args.precision,
+          args.profile, args.profile_summary, trace_steps, args.trace_dir)
@@ -0,0 +1,40 @@
+import tensorflow as tf
+
+# Test-time augmentation. Embryo images have no inherent orientation, so the
+# dihedral transforms below are label-preserving. All views of a frame group
+# are generated on-device and stacked into one batch, so the model runs a
+# single forward pass of size N * A instead of A separate passes.
+
+TRANSFORMS = {
+    'identity': lambda x: x,
+    'flip_h': lambda x: tf.reverse(x, axis=[2]),
+    'flip_v': lambda x: tf.reverse(x, axis=[1]),
+    'rot90': lambda x: tf.image.rot90(x, k=1),
+    'rot180': lambda x: tf.image.rot90(x, k=2),
+    'rot270': lambda x: tf.image.rot90(x, k=3),
+    'transpose': lambda x: tf.transpose(x, perm=[0, 2, 1, 3]),
+}
+
+def parse_transforms(spec):
+    """
+    Parses a comma-separated list such as 'flip_h,flip_v,rot90'.
+    'identity' is always the first view; an empty spec disables TTA.
+    """
+    names = [name.strip() for name in (spec or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in TRANSFORMS]
+    if unknown:
+        raise ValueError(f"Unknown TTA transforms {unknown}. Choose from {list(TRANSFORMS)}.")
+    return ('identity',) + tuple(name for name in dict.fromkeys(names) if name != 'identity')
+
+def augment_batch(images, transforms):
+    """
+    (N, H, W, C) -> (A * N, H, W, C), transform-major: rows [a*N:(a+1)*N] hold view a.
+    """
+    return tf.concat([TRANSFORMS[name](images) for name in transforms], axis=0)
+
+def reduce_views(outputs, n_transforms):
+    """
+    (A * N, ...) -> per-frame mean and variance over the A views.
+    """
+    views = tf.reshape(tf.cast(outputs, tf.float32), tf.concat([[n_transforms, -1], tf.shape(outputs)[1:]], axis=0))
+    return tf.reduce_mean(views, axis=0), tf.math.reduce_variance(views, axis=0)